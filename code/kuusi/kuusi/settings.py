@@ -98,6 +98,23 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# The local memory cache is bound to a single process.
+# For production use with multiple workers, a shared cache like Redis should be used instead, e. g.
+# "BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://127.0.0.1:6379"
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# Sessions are kept in the database per default, as the local memory cache is not shared between workers.
+# With a shared cache, "django.contrib.sessions.backends.cached_db" saves the session queries on each request.
+SESSION_ENGINE = "django.contrib.sessions.backends.db"
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
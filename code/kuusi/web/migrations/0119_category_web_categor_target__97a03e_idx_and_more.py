@@ -0,0 +1,29 @@
+# Generated by Django 4.2.15 on 2026-10-15 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("web", "0118_remove_session_display_mode"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="category",
+            index=models.Index(fields=["target_page", "child_of"], name="web_categor_target__97a03e_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="facetteselection",
+            index=models.Index(fields=["session", "facette"], name="web_facette_session_7a359a_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="session",
+            index=models.Index(fields=["result_id"], name="web_session_result__f568a5_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="translateable",
+            index=models.Index(fields=["catalogue_id", "is_invalidated"], name="web_transla_catalog_72976d_idx"),
+        ),
+    ]
@@ -19,7 +19,10 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from typing import Dict
 from web.models.http import WebHttpRequest
 from web.models import Translateable, TranslateableField, Session, Page
+from web.models.page import invalidate_page_cache
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 
 class Category(Translateable):
     name = TranslateableField(null=False, blank=False, max_length=120)# name AND catalogue id needs to be set, later focused on lranslation
@@ -44,6 +47,11 @@ class Category(Translateable):
         related_name="category_target_page",
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["target_page", "child_of"]),
+        ]
+
     def to_step(
         self,
         request: WebHttpRequest, 
@@ -69,7 +77,7 @@ class Category(Translateable):
             target = target_page.href
             css_classes = target_page.css_classes
 
-            if not target_page.is_visible(session):
+            if not target_page.is_visible_in_request(request):
                 return None
             is_answered = target_page.is_answered(session)
             is_marked = target_page.is_marked(session)
@@ -88,4 +96,9 @@ class Category(Translateable):
         }
 
     def __str__(self) -> str:
-        return f"[{self.icon}] {self.name} -> {self.target_page} (child of: {self.child_of})"
\ No newline at end of file
+        return f"[{self.icon}] {self.name} -> {self.target_page} (child of: {self.child_of})"
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, **kwargs):
+    invalidate_page_cache()
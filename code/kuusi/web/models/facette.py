@@ -122,6 +122,11 @@ class FacetteSelection(models.Model):
         default=0, validators=[MaxValueValidator(2), MinValueValidator(-2)]
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["session", "facette"]),
+        ]
+
 
 class FacetteAssignment(Translateable):
     choosables = models.ManyToManyField(to=Choosable)
@@ -17,7 +17,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 from typing import Tuple, Dict, List
-from django.db import models
+from django.db import models, transaction
 from web.models import Facette
 from web.models import Session, Widget, FacetteSelection, FacetteBehaviour, Page, PageMarking, WebHttpRequest
 from web.forms import WarningForm
@@ -128,14 +128,11 @@ class FacetteSelectionWidget(Widget):
         return active_facettes
 
     def proceed(self, request: WebHttpRequest, page: Page) -> bool:
-        # Always remove the facettes for the current widget to prevent permanent selections
-        FacetteSelection.objects.filter(
-            session=request.session_obj, facette__topic=self.topic
-        ).delete()
         # Get the posted facettes directly from the request to store new selections (including weights)
         active_facettes = self.get_active_facettes_raw(
             request, request.session_obj
         )
+        selections = []
         facette: Facette
         for facette in active_facettes:
             weight = 0
@@ -154,7 +151,14 @@ class FacetteSelectionWidget(Widget):
 
             select = FacetteSelection(facette=facette, session=request.session_obj)
             select.weight = weight
-            select.save()
+            selections.append(select)
+
+        with transaction.atomic():
+            # Always remove the facettes for the current widget to prevent permanent selections
+            FacetteSelection.objects.filter(
+                session=request.session_obj, facette__topic=self.topic
+            ).delete()
+            FacetteSelection.objects.bulk_create(selections, batch_size=500)
         
         facette_form, _ , _= self.build_form(request.POST, request.session_obj)
         # Make sure there is no double facette selections within this topic of the page
@@ -16,9 +16,11 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+from typing import Dict
 from django.http import HttpRequest
 
 class WebHttpRequest(HttpRequest):
     session_obj = None # web.models.Session
     has_behaviour_popups: bool = False
-    has_errors: bool = False
\ No newline at end of file
+    has_errors: bool = False
+    visible_pages: Dict[int, bool] | None = None # page pk -> visibility, valid for the lifetime of the request
\ No newline at end of file
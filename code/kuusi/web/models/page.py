@@ -17,15 +17,33 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 from __future__ import annotations
+from time import time_ns
+from django.core.cache import cache
 from django.db import models
-from django.db.models import Max, Min
+from django.db.models import Max, Min, Q, Exists
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
 from web.models import SessionVersionWidget, Translateable, TranslateableField, Session, WebHttpRequest, Widget, Facette, FacetteSelection
-from typing import List
+from typing import List, Set
 from logging import getLogger
 
 from django.apps import apps
 logger = getLogger("root")
 
+PAGE_CACHE_VERSION_KEY = "page-cache-version"
+
+def get_page_cache_version() -> int:
+    """
+    Returns the version to be used within cache keys of cached pages and categories.
+
+    The version changes each time a page or category is altered (also while importing with parse --wipe), which invalidates all cache entries using the old version.
+    Other workers or processes only see the new version if the cache is shared (see DOCKER.md).
+    """
+    return cache.get_or_set(PAGE_CACHE_VERSION_KEY, time_ns, timeout=None)
+
+def invalidate_page_cache():
+    cache.set(PAGE_CACHE_VERSION_KEY, time_ns(), timeout=None)
+
 class Page(Translateable):
     next_page = models.ForeignKey(
         to="Page",
@@ -61,6 +79,29 @@ class Page(Translateable):
             is_page_visible = False
         return is_page_visible
 
+    @staticmethod
+    def visible_ids(pages: List[Page], session: Session | None) -> Set[int]:
+        """
+        Returns the pks of the given pages which are visible in view of the session (see is_visible), using a single query
+        """
+        visible_pages = Page.objects.filter(pk__in=[page.pk for page in pages])
+        if session and session.version_id:
+            visible_pages = visible_pages.exclude(not_in_versions__pk=session.version_id)
+        visible_pages = visible_pages.filter(
+            Q(hide_if_no_selections=False) | Exists(FacetteSelection.objects.filter(session=session))
+        )
+        return set(visible_pages.values_list("pk", flat=True))
+
+    def is_visible_in_request(self, request: WebHttpRequest) -> bool:
+        """
+        Same as is_visible for the session of the request, but memoized within request.visible_pages (if present)
+        """
+        visible_pages = getattr(request, "visible_pages", None)
+        if visible_pages is None:
+            return self.is_visible(request.session_obj)
+        if self.pk not in visible_pages:
+            visible_pages[self.pk] = self.is_visible(request.session_obj)
+        return visible_pages[self.pk]
 
     def is_answered(self, session: Session):
         # TODO: Make this more variable if an answer could result in a text field value, for example.
@@ -91,8 +132,9 @@ class Page(Translateable):
     def previous_page(self) -> Page | None:
         return Page.objects.filter(next_page=self).first()
 
-    def next_visible_page(page: Page, session: Session) -> Page | None:
+    def next_visible_page(page: Page, request: WebHttpRequest) -> Page | None:
         # If the page is not visible, try to find a next displayable page.
+        # Returns None if none of the following pages is visible.
         fallback_page = None
         next_page = page.next_page
 
@@ -102,17 +144,15 @@ class Page(Translateable):
         attempts = 0
         next_page: Page
         while next_page is not None:
-            if next_page.is_visible(session):
+            if next_page.is_visible_in_request(request):
                 fallback_page = next_page
                 break
             next_page = next_page.next_page
             attempts +=1
             if attempts >= max_attempts:
                 raise Exception("Page loop detected")
-        if fallback_page:
-            page = fallback_page
-        
-        return page
+
+        return fallback_page
 
     @property
     def widget_list(self) -> List[Widget]:
@@ -243,6 +283,12 @@ class Page(Translateable):
                 for facette in facettes:
                     FacetteSelection.objects.filter(session=session,facette=facette).delete()
 
+@receiver(post_save, sender=Page)
+@receiver(post_delete, sender=Page)
+@receiver(m2m_changed, sender=Page.not_in_versions.through)
+def page_changed(sender, **kwargs):
+    invalidate_page_cache()
+
 class PageMarking(models.Model):
     page = models.ForeignKey(
         to=Page,
@@ -72,6 +72,11 @@ class Session(models.Model):
     is_ack = models.BooleanField(default=False) # A session will be 'acknowledged' by a JS snippet to exclude curl() calls
     language_code = models.CharField(max_length=10, default="en", null=False, blank=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["result_id"]),
+        ]
+
     def get_meta_value(self, key: str) -> str | None:
         matches = SessionMeta.objects.filter(session=self, meta_key=key)
         if matches.count() < 1:
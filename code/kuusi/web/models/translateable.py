@@ -38,8 +38,9 @@ from kuusi.settings import (
 )
 
 TRANSLATIONS = {}
-INCOMPLETE_TRANSLATIONS = []
-RTL_TRANSLATIONS = ["he"]
+# Sets, as these are used for membership tests on each request
+INCOMPLETE_TRANSLATIONS = set()
+RTL_TRANSLATIONS = frozenset(["he"])
 
 def hot_load_translations(**kwargs):
     path = join(LOCALE_PATHS[0])
@@ -60,7 +61,7 @@ def hot_load_translations(**kwargs):
         if locale != "en":
             for key, value in TRANSLATIONS[locale].items():
                 if value == TRANSLATIONS["en"][key]:
-                    INCOMPLETE_TRANSLATIONS.append(locale)
+                    INCOMPLETE_TRANSLATIONS.add(locale)
                     break
 
 
@@ -132,6 +133,11 @@ class Translateable(models.Model):
 
     is_invalidated = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["catalogue_id", "is_invalidated"]),
+        ]
+
     def __str__(self) -> str:
         return f"({self.catalogue_id})"
     def get_msgd_id_of_field(self, key: str) -> str:
@@ -16,10 +16,15 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 from django.core.cache import cache
-from typing import List, Tuple, Dict
+from django.db import transaction
+from django.db.models import F, Q
+from collections import deque
+from functools import lru_cache
+from time import time
+from typing import Deque, List, Tuple, Dict
 from django.http import (
     HttpResponse,
-    HttpResponseNotAllowed,
+    HttpResponseForbidden,
     HttpResponseRedirect
 )
 from django.http import Http404
@@ -41,32 +46,56 @@ from kuusi.settings import (
 from web.models import Page, Session, WebHttpRequest, Category, FacetteSelection, Choosable, ChoosableMeta, FacetteAssignment, Feedback, SessionMeta
 from web.helper import forward_helper
 from web.models.translateable import INCOMPLETE_TRANSLATIONS
+from web.models.page import get_page_cache_version
 from logging import getLogger
 
 logger = getLogger("root")
 
+# The index template is resolved once per process. In DEBUG, it's resolved per request to pick up template changes.
+INDEX_TEMPLATE = None if DEBUG else loader.get_template("index.html")
 
-def get_page_route(page: Page) -> List[Page]: 
+# Seconds a process keeps the page graph, as changes of other workers are not visible without a shared cache.
+PAGE_GRAPH_TIMEOUT = 300
+
+@lru_cache(maxsize=1)
+def get_page_graph(page_cache_version: int, time_bucket: int) -> Tuple[Dict[int, Page], Dict[int, Page]]:
+    """
+    Returns all pages and their previous pages, both by pk.
+
+    The result is kept per process until the page cache version or the time bucket (see PAGE_GRAPH_TIMEOUT) changes, or get_page_route finds a page missing in it. The pages must not be altered.
+    """
+    # Only the fields needed to build the route are loaded, the pages are just used for navigation purposes.
+    all_pages: Dict[int, Page] = {
+        p.pk: p for p in Page.objects.only("catalogue_id", "next_page").order_by("pk")
+    }
+    previous_pages: Dict[int, Page] = {}
+    for chained_page in all_pages.values():
+        if chained_page.next_page_id is not None:
+            previous_pages.setdefault(chained_page.next_page_id, chained_page)
+    return all_pages, previous_pages
+
+def get_page_route(page: Page, page_cache_version: int) -> List[Page]: 
     """
     Get a next page and all available pages from the given page as a start point
+
+    The pages are chained in memory using get_page_graph, as following the next_page/ previous_page relations would cause a query per page.
     """
-    pages = []
-    prev_page = page.previous_page
+    time_bucket = int(time() // PAGE_GRAPH_TIMEOUT)
+    all_pages, previous_pages = get_page_graph(page_cache_version, time_bucket)
+    if page.pk not in all_pages:
+        # The graph was built before the page was imported (e. g. by another process), so it is rebuilt.
+        get_page_graph.cache_clear()
+        all_pages, previous_pages = get_page_graph(page_cache_version, time_bucket)
+    pages: Deque[Page] = deque([page])
+    prev_page = previous_pages.get(page.pk)
     while prev_page is not None:
-        if prev_page:
-            pages = [prev_page] + pages
-            prev_page = prev_page.previous_page
-        else:
-            prev_page = None
-    pages.append(page)
-    next_page = page.next_page
+        pages.appendleft(prev_page)
+        prev_page = previous_pages.get(prev_page.pk)
+    next_page = all_pages.get(page.next_page_id)
     while next_page is not None:
-        if next_page:
-            pages.append(next_page)
-            next_page = next_page.next_page
-        else:
-            next_page = None
-    return pages
+        pages.append(next_page)
+        next_page = all_pages.get(next_page.next_page_id)
+    return list(pages)
 
 def get_session(request: WebHttpRequest, param_id: str=None) -> Tuple[bool, Session]:
     # Get a session object based on the informations present. If no result_id is existing withing the session a new session will be started
@@ -84,7 +113,7 @@ def get_session(request: WebHttpRequest, param_id: str=None) -> Tuple[bool, Sess
         else:
             session = Session.objects.filter(
                 result_id=request.session["result_id"]
-            ).first()
+            ).defer("user_agent", "referrer").first()
             logger.debug(f"Resumed old session {session.result_id}")
 
     if is_new and param_id is not None: 
@@ -98,46 +127,51 @@ def get_session(request: WebHttpRequest, param_id: str=None) -> Tuple[bool, Sess
     request.session["result_id"] = session.result_id
     return is_new, session
 
+@transaction.atomic
 def get_fresh_session(request: WebHttpRequest) -> Session:
-    user_agent = request.headers.get("user-agent")
-    session = Session(user_agent=user_agent)
-    session.save()
-    session.referrer = request.headers.get("referrer")
-    for group, items in DEFAULT_SESSION_META.items():
-        for item in items:
-            meta = SessionMeta()
-            meta.meta_key = group
-            meta.meta_value = item
-            meta.session = session
-            meta.save()
-
-    session.referrer = request.headers.get("referrer")
+    # All known values are set before the session is inserted, so the session is written only once.
+    session = Session(
+        user_agent=request.headers.get("user-agent"),
+        referrer=request.headers.get("referrer"),
+        language_code=request.LANGUAGE_CODE
+    )
     session.save()
+    SessionMeta.objects.bulk_create([
+        SessionMeta(session=session, meta_key=group, meta_value=item)
+        for group, items in DEFAULT_SESSION_META.items()
+        for item in items
+    ])
     return session
 
+@transaction.atomic
 def clone_selections(id: str, request: WebHttpRequest, session: Session):
-    old_session = Session.objects.filter(result_id=id).first()
+    old_session = Session.objects.filter(result_id=id).only("started", "result_id").first()
     if session.session_origin is not None and session.session_origin.result_id == id:
         logger.debug(f"Aborting copy to prevent double copy")
         return
     if old_session:
         logger.debug(f"Found old session {old_session}")
         if not session.session_origin:
-            selections = FacetteSelection.objects.filter(session=old_session)
-            selection: FacetteSelection
-            for selection in selections:
-                # prevent double copies
-                if (
-                    FacetteSelection.objects.filter(
-                        session=session, facette=selection.facette
-                    ).count()
-                    == 0
-                ):
-                    selection.pk = None
-                    selection.session = session
-                    selection.save()
+            # prevent double copies
+            existing_facettes = FacetteSelection.objects.filter(
+                session=session
+            ).values_list("facette_id", flat=True)
+            selections = FacetteSelection.objects.filter(
+                session=old_session
+            ).exclude(facette_id__in=existing_facettes)
+            FacetteSelection.objects.bulk_create(
+                [
+                    FacetteSelection(
+                        session=session,
+                        facette_id=selection.facette_id,
+                        weight=selection.weight,
+                    )
+                    for selection in selections
+                ],
+                batch_size=1000,
+            )
             session.session_origin = old_session
-            session.save()
+            Session.objects.filter(pk=session.pk).update(session_origin=old_session)
         else:
             if session.session_origin != old_session:
                 logger.debug(f"This is a new session, but the user has a session.")
@@ -150,46 +184,58 @@ def clone_selections(id: str, request: WebHttpRequest, session: Session):
                     f"Skipping selection copy, the session {session} is already linked to session {old_session}"
                 )
 
-def get_categories_and_filtered_pages(page: Page, session: Session) -> Tuple[List[Page], List[Category]]: 
+def get_route_categories(page: Page, request: WebHttpRequest, page_cache_version: int) -> List[Category]: 
+    session = request.session_obj
+    # Get the categories of the route of the given page, suitable for the currently existing session
     # get the categories in an order fitting the pages
-    pages = get_page_route(page)
-    # Get Categories and pages suitable for the currently existing session
-    cached_version = cache.get(f"get_categories_and_filtered_pages-pages-{session.version}")
-    if cached_version:
-        logger.debug("Returning cached categories and pages")
-        return cache.get(f"get_categories_and_filtered_pages-pages-{session.version}"), cache.get(f"get_categories_and_filtered_pages-categories-{session.version}")
-    
-    version_comp_pages = []
-    chained_page: Page
-    for chained_page in pages:
-        if chained_page.is_visible(session):
-            version_comp_pages.append(chained_page)
-
+    pages = get_page_route(page, page_cache_version)
+
+    # The visibility is evaluated for all pages of the route at once, also if the categories are cached, as the steps need it.
+    visible_ids = Page.visible_ids(pages, session)
+    request.visible_pages.update({chained_page.pk: chained_page.pk in visible_ids for chained_page in pages})
+
+    cache_key = f"get_route_categories-{session.version}-{page_cache_version}"
+    categories = cache.get(cache_key)
+    if categories is not None:
+        logger.debug("Returning cached categories")
+        return categories
+
+    # The top level categories of the pages and their children are fetched at once, the steps are created later using them.
+    page_ids = [chained_page.pk for chained_page in pages]
+    route_categories = Category.objects.filter(
+        Q(target_page_id__in=page_ids, child_of__isnull=True)
+        | Q(child_of__target_page_id__in=page_ids, child_of__child_of__isnull=True)
+    ).select_related("target_page").order_by("pk")
+    category_by_page: Dict[int, Category] = {}
+    children_by_category: Dict[int, List[Category]] = {}
+    category: Category
+    for category in route_categories:
+        if category.child_of_id is None:
+            category_by_page.setdefault(category.target_page_id, category)
+        else:
+            children_by_category.setdefault(category.child_of_id, []).append(category)
     categories = []
-    for chained_page in pages:
-        # Child categories will be created later, when the steps are created.
-        used_in_category = Category.objects.filter(
-            target_page=chained_page, child_of__isnull=True
-        )
-        if used_in_category.count() > 0:
-            categories.append(used_in_category.first())
-    cache.set(f"get_categories_and_filtered_pages-pages-{session.version}", version_comp_pages)
-    cache.set(f"get_categories_and_filtered_pages-categories-{session.version}", categories)
-    return version_comp_pages, categories
+    for page_id in page_ids:
+        if page_id in category_by_page:
+            category = category_by_page[page_id]
+            category.children = children_by_category.get(category.pk, [])
+            categories.append(category)
+    cache.set(cache_key, categories)
+    return categories
 
 def build_step_data(categories: List[Category], request: WebHttpRequest):
     step_data = []
+    last_index = len(categories) - 1
     index: int
     category: Category
     for index, category in enumerate(categories):
         minor_steps = []
         category_step = category.to_step(
             request,
-            index == categories.__len__() - 1,
+            index == last_index,
         )
-        child_categories = Category.objects.filter(child_of=category)
         child_category: Category
-        for child_category in child_categories:
+        for child_category in category.children:
             minor_steps.append(
                 child_category.to_step(
                     request,
@@ -204,18 +250,15 @@ def build_step_data(categories: List[Category], request: WebHttpRequest):
     return step_data
 
 def route_outgoing(request: WebHttpRequest, id: int, property: str) -> HttpResponse:
-    got = Choosable.objects.filter(pk=id) 
-    property = property.upper()
-    if got.count() == 1:
-        choosable: Choosable = got.first()
-        if choosable:
-            if property not in choosable.meta:
-                raise Http404()
-            else:
-                choosable.clicked += 1
-                choosable.save()
-                return HttpResponseRedirect(choosable.meta[property].meta_value)
-    raise Http404()
+    # The meta names are compared case insensitive, similar to Choosable.meta
+    meta: ChoosableMeta = ChoosableMeta.objects.filter(
+        meta_choosable_id=id, meta_name__iexact=property
+    ).only("meta_value").order_by("meta_name").last()
+    if not meta:
+        raise Http404()
+    # Increase the counter within the database to not lose clicks of concurrent requests
+    Choosable.objects.filter(pk=id).update(clicked=F("clicked") + 1)
+    return HttpResponseRedirect(meta.meta_value)
 
 
 def route_index(request: WebHttpRequest, language_code: str = None, id: str = None):
@@ -226,21 +269,31 @@ def route_index(request: WebHttpRequest, language_code: str = None, id: str = No
     # Get the current page
     page_id = request.GET.get("page")
     page = None
+    page_cache_version = get_page_cache_version()
     if page_id:
-        page = Page.objects.get(catalogue_id=page_id)
+        page = cache.get_or_set(
+            f"route_index-page-{page_id}-{page_cache_version}",
+            lambda: Page.objects.get(catalogue_id=page_id),
+            timeout=300
+        )
     else:
-        page = Page.objects.first()
-
-    _, session = get_session(request, id)
+        page = cache.get_or_set(
+            f"route_index-page-{page_cache_version}",
+            Page.objects.first,
+            timeout=300
+        )
 
     # i18n handling
     request.LANGUAGE_CODE = (
         DEFAULT_LANGUAGE_CODE if not language_code else language_code
     )
+
+    _is_new_session, session = get_session(request, id)
+
     if session.language_code != request.LANGUAGE_CODE:
         logger.debug(f"Session lang was {session.language_code} is now {request.LANGUAGE_CODE}")
+        Session.objects.filter(pk=session.pk).update(language_code=request.LANGUAGE_CODE)
         session.language_code = request.LANGUAGE_CODE
-        session.save()
     translation.activate(request.LANGUAGE_CODE) 
 
     # If the id is none -> Redirect the user to a URL representing the entire state
@@ -267,29 +320,25 @@ def route_index(request: WebHttpRequest, language_code: str = None, id: str = No
             return response
        
 
-    # Build the navigation/ Categories
-    pages, categories = get_categories_and_filtered_pages(page, session)
+    # The visibility of pages is requested multiple times while building the navigation -> remember it for this request.
+    # As the forward_helper might change the session version or selections, this is only done afterwards.
+    request.visible_pages = {}
 
-  
-    
-    current_location = request.get_full_path()
-    # If the user is curently on the start page -> use the first available site as "current location"
-    if current_location.__len__() <= 1:
-        current_location = base_url + pages[0].href
+    # Build the navigation/ Categories
+    categories = get_route_categories(page, request, page_cache_version)
 
     """
     In Case the desired page is not active within the current version -> attempt to find the next one suitable
 
-    If not page is suitable, it will result in a 405 later.
+    If not page is suitable, it will result in a 403 before anything is rendered.
     """
-    if not page.is_visible(session):
-        page = Page.next_visible_page(page, session)
+    if not page.is_visible_in_request(request):
+        page = Page.next_visible_page(page, request)
+    if page is None:
+        return HttpResponseForbidden(str(_("PAGE_NOT_AVAILABLE")))
 
     step_data = build_step_data(categories, request)
 
-    if not page.is_visible(request.session_obj):
-        return HttpResponseNotAllowed(_("PAGE_NOT_AVAILABLE"))
-
     context = {
         "title": KUUSI_NAME,
         "page": page,
@@ -313,15 +362,18 @@ def route_index(request: WebHttpRequest, language_code: str = None, id: str = No
         )
 
     logger.debug(f"Status overwrite is {overwrite_status}")
-    template = loader.get_template("index.html")
+    template = INDEX_TEMPLATE if INDEX_TEMPLATE else loader.get_template("index.html")
 
+    # Turbo calls are answered with a regular HttpResponse on purpose:
+    # The Django template engine renders the entire document (index.html extends _layout.html) before returning it,
+    # so a StreamingHttpResponse would not send any byte earlier.
     return HttpResponse(template.render(context, request), status=overwrite_status)
 
 
 def route_feedback(request: WebHttpRequest,assignment_id: int, choosable_id: int):
     assignment: FacetteAssignment = FacetteAssignment.objects.get(pk=assignment_id)
     choosable: Choosable = Choosable.objects.get(pk=choosable_id)
-    session: Session = Session.objects.get(result_id=request.session.get("result_id"))
+    session: Session = Session.objects.only("result_id", "language_code").get(result_id=request.session.get("result_id"))
     is_new = True
     if not assignment.is_flagged(choosable):
         Feedback.objects.create(
@@ -16,6 +16,54 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import translation
+from django.utils.translation import gettext_lazy as _
 
-# Create your tests here.
+from web.models import Page, Session, SessionVersion, WebHttpRequest
+
+
+class NextVisiblePageTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Saving translateables writes the msg ids into the locale files, which should not end up in the locale folder of the repository.
+        locale_dir = TemporaryDirectory()
+        self.addCleanup(locale_dir.cleanup)
+        locale_patch = patch("web.models.translateable.LOCALE_PATHS", (locale_dir.name,))
+        locale_patch.start()
+        self.addCleanup(locale_patch.stop)
+        self.version = SessionVersion.objects.create(catalogue_id="test-version")
+        self.last_page = Page.objects.create(catalogue_id="last-page")
+        self.hidden_page = Page.objects.create(catalogue_id="hidden-page", next_page=self.last_page)
+        self.first_page = Page.objects.create(catalogue_id="first-page", next_page=self.hidden_page)
+        self.hidden_page.not_in_versions.add(self.version)
+        self.session = Session.objects.create(version=self.version)
+
+    def get_request(self) -> WebHttpRequest:
+        request = WebHttpRequest()
+        request.session_obj = self.session
+        request.visible_pages = {}
+        return request
+
+    def test_returns_next_visible_page(self):
+        self.assertEqual(Page.next_visible_page(self.hidden_page, self.get_request()), self.last_page)
+        self.assertEqual(Page.next_visible_page(self.first_page, self.get_request()), self.last_page)
+
+    def test_returns_none_without_visible_page(self):
+        self.last_page.not_in_versions.add(self.version)
+        self.assertIsNone(Page.next_visible_page(self.first_page, self.get_request()))
+        self.assertIsNone(Page.next_visible_page(self.last_page, self.get_request()))
+
+    def test_route_index_without_visible_page(self):
+        self.first_page.not_in_versions.add(self.version)
+        self.last_page.not_in_versions.add(self.version)
+        response = self.client.get("/en/")
+        self.assertEqual(response.status_code, 302)
+        Session.objects.filter(result_id=self.client.session["result_id"]).update(version=self.version)
+        response = self.client.get(response["Location"])
+        self.assertEqual(response.status_code, 403)
+        with translation.override("en"):
+            self.assertEqual(response.content.decode(), str(_("PAGE_NOT_AVAILABLE")))